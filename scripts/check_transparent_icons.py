@@ -3,12 +3,17 @@
 
 from __future__ import annotations
 
+import mmap
+import os
 import struct
 import sys
 import zlib
+from collections.abc import Iterator
 from pathlib import Path
 
 PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_CHUNK_HEADER = struct.Struct(">I4s")  # length, type
+_IHDR = struct.Struct(">IIBBBBB")
 REQUIRED_ICON_FILES = [
     Path("src-tauri/icons/32x32.png"),
     Path("src-tauri/icons/128x128.png"),
@@ -16,132 +21,181 @@ REQUIRED_ICON_FILES = [
     Path("src-tauri/icons/logo.png"),
 ]
 
+# Byte-lane masks for SWAR arithmetic on packed 4-byte RGBA pixels.
+_LANES_LOW7 = 0x7F7F7F7F
+_LANES_HIGH = 0x80808080
+_LANES_NO_LSB = 0xFEFEFEFE
 
-def _paeth(a: int, b: int, c: int) -> int:
-    p = a + b - c
-    pa = abs(p - a)
-    pb = abs(p - b)
-    pc = abs(p - c)
-    if pa <= pb and pa <= pc:
-        return a
-    if pb <= pc:
-        return b
-    return c
 
-
-def png_has_transparency(path: Path) -> bool:
-    data = path.read_bytes()
-    if not data.startswith(PNG_SIGNATURE):
-        raise ValueError(f"{path} is not a PNG file")
-
-    i = len(PNG_SIGNATURE)
-    width = height = bit_depth = color_type = None
-    trns_chunk = None
-    idat = bytearray()
-
-    while i < len(data):
-        if i + 8 > len(data):
-            raise ValueError(f"{path} is truncated (invalid chunk header)")
-
-        length = struct.unpack(">I", data[i : i + 4])[0]
-        chunk_type = data[i + 4 : i + 8]
-        chunk_start = i + 8
-        chunk_end = chunk_start + length
-        crc_end = chunk_end + 4
-        if crc_end > len(data):
-            raise ValueError(f"{path} is truncated (invalid chunk length)")
-
-        chunk_data = data[chunk_start:chunk_end]
-        i = crc_end
-
-        if chunk_type == b"IHDR":
-            width, height, bit_depth, color_type, *_ = struct.unpack(">IIBBBBB", chunk_data)
-        elif chunk_type == b"tRNS":
-            trns_chunk = chunk_data
-        elif chunk_type == b"IDAT":
-            idat.extend(chunk_data)
-        elif chunk_type == b"IEND":
-            break
-
-    if width is None or height is None or bit_depth is None or color_type is None:
-        raise ValueError(f"{path} is missing IHDR")
-    if bit_depth != 8:
-        raise ValueError(f"{path} has unsupported bit depth: {bit_depth}")
-
-    if color_type == 6:  # RGBA
-        bpp = 4
-    elif color_type == 3:  # Indexed
-        bpp = 1
-    elif color_type in (0, 2, 4):
-        # Grayscale / RGB variants with no meaningful alpha channel for this check.
-        return False
-    else:
-        raise ValueError(f"{path} has unsupported color type: {color_type}")
-
-    raw = zlib.decompress(bytes(idat))
+def _iter_rgba_rows(path: Path, raw: bytes, width: int, height: int) -> Iterator[bytearray]:
+    """Undo the per-row PNG filters of 8-bit RGBA scanlines, yielding each row."""
+    bpp = 4
     row_len = width * bpp
-    expected_len = height * (1 + row_len)
-    if len(raw) != expected_len:
-        raise ValueError(f"{path} has unexpected decompressed size")
+    row_low7 = int.from_bytes(b"\x7f" * row_len, "little")
+    row_high = int.from_bytes(b"\x80" * row_len, "little")
 
-    out = bytearray(height * row_len)
+    # Filters only ever look one row back, so that row is all the history kept.
+    prev = bytes(row_len)
     raw_index = 0
-    for y in range(height):
+    for _ in range(height):
         filter_type = raw[raw_index]
         raw_index += 1
 
         row = bytearray(raw[raw_index : raw_index + row_len])
         raw_index += row_len
 
-        prev = out[(y - 1) * row_len : y * row_len] if y > 0 else bytes(row_len)
-
         if filter_type == 0:
             pass
-        elif filter_type == 1:
-            for x in range(row_len):
-                left = row[x - bpp] if x >= bpp else 0
-                row[x] = (row[x] + left) & 0xFF
         elif filter_type == 2:
-            for x in range(row_len):
-                row[x] = (row[x] + prev[x]) & 0xFF
-        elif filter_type == 3:
-            for x in range(row_len):
-                left = row[x - bpp] if x >= bpp else 0
-                row[x] = (row[x] + ((left + prev[x]) // 2)) & 0xFF
+            # Up has no intra-row dependency, so add the whole row at once as big ints
+            # using per-byte carry-less addition.
+            cur = int.from_bytes(row, "little")
+            up = int.from_bytes(prev, "little")
+            row = bytearray(
+                (((cur & row_low7) + (up & row_low7)) ^ ((cur ^ up) & row_high)).to_bytes(
+                    row_len, "little"
+                )
+            )
+        elif filter_type in (1, 3):
+            # Sub and Average depend on the pixel to the left, so walk one packed
+            # pixel (4 byte lanes) at a time instead of one byte at a time.
+            left = 0
+            with memoryview(row).cast("I") as pixels:
+                if filter_type == 1:
+                    for x in range(width):
+                        cur = pixels[x]
+                        left = ((cur & _LANES_LOW7) + (left & _LANES_LOW7)) ^ (
+                            (cur ^ left) & _LANES_HIGH
+                        )
+                        pixels[x] = left
+                else:
+                    with memoryview(prev).cast("I") as prev_pixels:
+                        for x in range(width):
+                            cur = pixels[x]
+                            up = prev_pixels[x]
+                            avg = (left & up) + (((left ^ up) & _LANES_NO_LSB) >> 1)
+                            left = ((cur & _LANES_LOW7) + (avg & _LANES_LOW7)) ^ (
+                                (cur ^ avg) & _LANES_HIGH
+                            )
+                            pixels[x] = left
         elif filter_type == 4:
-            for x in range(row_len):
-                left = row[x - bpp] if x >= bpp else 0
-                up = prev[x]
-                up_left = prev[x - bpp] if x >= bpp else 0
-                row[x] = (row[x] + _paeth(left, up, up_left)) & 0xFF
+            # Paeth runs one channel lane (every 4th byte) at a time so the left and
+            # up-left neighbours are carried in locals rather than re-indexed per byte.
+            # Starting both at 0 makes the first pixel reduce to Up, as the spec requires.
+            for lane in range(bpp):
+                a = c = 0
+                lane_out = bytearray()
+                for filt, b in zip(row[lane::bpp], prev[lane::bpp]):
+                    pa = abs(b - c)
+                    pb = abs(a - c)
+                    pc = abs(a + b - c - c)
+                    predictor = a if pa <= pb and pa <= pc else b if pb <= pc else c
+                    a = (filt + predictor) & 0xFF
+                    lane_out.append(a)
+                    c = b
+                row[lane::bpp] = lane_out
         else:
             raise ValueError(f"{path} has unknown PNG filter type: {filter_type}")
 
-        out[y * row_len : (y + 1) * row_len] = row
+        yield row
+        prev = row
+
+
+def png_has_transparency(path: Path) -> bool:
+    width = height = bit_depth = color_type = None
+    trns_chunk = None
+    # IDAT is inflated as it is parsed rather than concatenated and inflated at the end.
+    decompressor = zlib.decompressobj()
+    raw = bytearray()
+
+    with path.open("rb") as file:
+        # mmap cannot map an empty file, and anything shorter than the signature is
+        # not a PNG anyway.
+        if os.fstat(file.fileno()).st_size < len(PNG_SIGNATURE):
+            raise ValueError(f"{path} is not a PNG file")
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(PNG_SIGNATURE)] != PNG_SIGNATURE:
+                raise ValueError(f"{path} is not a PNG file")
+
+            i = len(PNG_SIGNATURE)
+            while i < len(data):
+                if i + _CHUNK_HEADER.size > len(data):
+                    raise ValueError(f"{path} is truncated (invalid chunk header)")
+
+                length, chunk_type = _CHUNK_HEADER.unpack_from(data, i)
+                chunk_start = i + _CHUNK_HEADER.size
+                chunk_end = chunk_start + length
+                crc_end = chunk_end + 4
+                if crc_end > len(data):
+                    raise ValueError(f"{path} is truncated (invalid chunk length)")
+
+                i = crc_end
+
+                # Views must be released before the map closes, hence the with block.
+                with memoryview(data)[chunk_start:chunk_end] as chunk_data:
+                    if chunk_type == b"IHDR":
+                        width, height, bit_depth, color_type, *_ = _IHDR.unpack(chunk_data)
+                        if bit_depth != 8:
+                            raise ValueError(
+                                f"{path} has unsupported bit depth: {bit_depth}"
+                            )
+                        if color_type in (0, 2, 4):
+                            # Grayscale / RGB variants with no meaningful alpha channel for
+                            # this check, so the remaining chunks are irrelevant.
+                            return False
+                    elif chunk_type == b"tRNS":
+                        trns_chunk = bytes(chunk_data)
+                    elif chunk_type == b"IDAT" and color_type == 6:
+                        # Only RGBA pixels are ever decoded.
+                        raw += decompressor.decompress(chunk_data)
+                    elif chunk_type == b"IEND":
+                        break
+
+    if width is None or height is None or bit_depth is None or color_type is None:
+        raise ValueError(f"{path} is missing IHDR")
+
+    if color_type == 3:  # Indexed
+        # Palette alpha lives entirely in tRNS, so the pixel data never needs decoding.
+        return trns_chunk is not None and min(trns_chunk, default=255) < 255
+    if color_type != 6:  # RGBA is the only type that needs its pixels decoded.
+        raise ValueError(f"{path} has unsupported color type: {color_type}")
+
+    raw += decompressor.flush()
+    if not decompressor.eof:
+        raise ValueError(f"{path} has truncated image data")
+    expected_len = height * (1 + width * 4)
+    if len(raw) != expected_len:
+        raise ValueError(f"{path} has unexpected decompressed size")
+
+    # Stop at the first row with a non-opaque pixel; only fully opaque icons need
+    # every row reconstructed.
+    for row in _iter_rgba_rows(path, raw, width, height):
+        if min(row[3::4], default=255) < 255:
+            return True
+    return False
+
 
-    if color_type == 6:
-        alpha = out[3::4]
-        return any(a < 255 for a in alpha)
+def _check_icon(icon_path: Path) -> str | None:
+    """Return a failure message for the icon, or None if it passes."""
+    if not icon_path.exists():
+        return f"Missing icon file: {icon_path}"
 
-    # color_type == 3
-    if trns_chunk is None:
-        return False
-    return any(a < 255 for a in trns_chunk)
+    try:
+        if not png_has_transparency(icon_path):
+            return f"No transparent pixels found in {icon_path}"
+    except Exception as exc:  # pylint: disable=broad-except
+        return f"Failed to validate {icon_path}: {exc}"
+    return None
 
 
 def main() -> int:
     failures: list[str] = []
 
     for icon_path in REQUIRED_ICON_FILES:
-        if not icon_path.exists():
-            failures.append(f"Missing icon file: {icon_path}")
-            continue
-
-        try:
-            if not png_has_transparency(icon_path):
-                failures.append(f"No transparent pixels found in {icon_path}")
-        except Exception as exc:  # pylint: disable=broad-except
-            failures.append(f"Failed to validate {icon_path}: {exc}")
+        failure = _check_icon(icon_path)
+        if failure is not None:
+            failures.append(failure)
 
     if failures:
         print("Icon transparency check failed:")